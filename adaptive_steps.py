@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+
+DEFAULT_NFE_STEP = 32
+DEFAULT_CFG_STRENGTH = 2
+CANDIDATE_STEPS = (8, 12, 16, 24)
+# 未校准时的长度分段：(最大字符数, 相对默认步数的比例)
+DEFAULT_BUCKETS = ((8, 0.5), (20, 0.75))
+
+
+def spectral_distance(a, b, n_fft=1024, hop=256):
+    """两段音频对数幅度谱的平均绝对差（dB），用于衡量减少步数后的质量损失"""
+    n = min(len(a), len(b))
+    if n < n_fft:
+        n_fft = hop = max(n, 1)
+    window = np.hanning(n_fft)
+
+    def log_spec(x):
+        x = np.asarray(x[:n], dtype=np.float64)
+        frames = [x[i:i + n_fft] * window for i in range(0, n - n_fft + 1, hop)]
+        mag = np.abs(np.fft.rfft(np.array(frames), axis=1))
+        return 20 * np.log10(mag + 1e-5)
+
+    return float(np.mean(np.abs(log_spec(a) - log_spec(b))))
+
+
+class StepScheduler:
+    """按句子长度选择扩散步数（NFE）以及是否跳过 CFG
+
+    有校准文件时使用校准结果，否则按默认长度分段：短句用更少的步数，长句保持默认步数。
+    """
+
+    def __init__(self, nfe_step=DEFAULT_NFE_STEP, cfg_strength=DEFAULT_CFG_STRENGTH,
+                 adaptive=False, calibration_file=None, skip_cfg=False):
+        self.nfe_step = nfe_step
+        self.cfg_strength = cfg_strength
+        self.adaptive = adaptive
+        self.skip_cfg = skip_cfg
+        self.buckets = [{"max_chars": c, "nfe_step": max(int(nfe_step * r), 1), "skip_cfg": False}
+                        for c, r in DEFAULT_BUCKETS]
+        if calibration_file and os.path.exists(calibration_file):
+            with open(calibration_file, "r", encoding="utf-8") as f:
+                self.buckets = json.load(f)["buckets"]
+
+    def choose(self, chars):
+        """返回 (nfe_step, cfg_strength)"""
+        if not self.adaptive:
+            return self.nfe_step, self.cfg_strength
+        for bucket in sorted(self.buckets, key=lambda b: b["max_chars"]):
+            if chars <= bucket["max_chars"]:
+                cfg_strength = 0 if self.skip_cfg and bucket.get("skip_cfg") else self.cfg_strength
+                return min(bucket["nfe_step"], self.nfe_step), cfg_strength
+        return self.nfe_step, self.cfg_strength
+
+
+def calibrate(synthesize, samples, budget, nfe_step=DEFAULT_NFE_STEP, cfg_strength=DEFAULT_CFG_STRENGTH,
+              candidates=CANDIDATE_STEPS, bucket_limits=(8, 20, 40)):
+    """用参考输出校准每个长度分段可用的最少步数
+
+    synthesize(text, nfe_step, cfg_strength) 必须使用固定随机种子并返回波形；samples 为 [(字符数, 文本)]。
+    某个分段内所有样本与默认步数输出的谱距离都不超过 budget 时，才采用该步数。
+    """
+    buckets = []
+    lower = 0
+    for limit in bucket_limits:
+        texts = [t for c, t in samples if lower < c <= limit]
+        lower = limit
+        if not texts:
+            continue
+        references = [synthesize(t, nfe_step, cfg_strength) for t in texts]
+        chosen, distance = nfe_step, 0.0
+        for steps in sorted(s for s in candidates if s < nfe_step):
+            worst = max(spectral_distance(ref, synthesize(t, steps, cfg_strength))
+                        for t, ref in zip(texts, references))
+            print(f"  <= {limit} chars, {steps} steps: distance {worst:.2f} dB")
+            if worst <= budget:
+                chosen, distance = steps, worst
+                break
+        skip_cfg = False
+        if cfg_strength > 0:
+            worst = max(spectral_distance(ref, synthesize(t, chosen, 0))
+                        for t, ref in zip(texts, references))
+            print(f"  <= {limit} chars, {chosen} steps without CFG: distance {worst:.2f} dB")
+            skip_cfg = worst <= budget
+        buckets.append({"max_chars": limit, "nfe_step": chosen, "skip_cfg": skip_cfg,
+                        "distance": distance, "samples": len(texts)})
+    return {"metric": "log_spectral_distance_db", "budget": budget, "nfe_step": nfe_step, "buckets": buckets}
@@ -0,0 +1,232 @@
+import io
+import json
+import mmap
+import os
+import time
+
+import numpy as np
+
+FORMATS = ("flac", "pcm")
+
+
+class AudioStore:
+    """把句子文本和音频打包到单个文件（audio.pack）中，用 JSON 索引记录偏移
+
+    音频按缓存键存放，文本或设置未变化的句子可以直接复用。pcm 格式可以通过内存映射零拷贝读取，
+    flac 格式占用空间更小。被替换的音频会成为死空间，可用 compact() 回收。
+
+    索引每 flush_every 次写入或每 flush_interval 秒才整体重写一次，期间每条音频的索引记录
+    追加到 audio.journal，中途崩溃时下次打开会从日志恢复。结束写入后需调用 flush()。
+    """
+
+    def __init__(self, audio_dir, audio_format="flac", flush_every=200, flush_interval=30):
+        if audio_format not in FORMATS:
+            raise ValueError(f"Audio format must be one of {', '.join(FORMATS)}")
+        self.audio_dir = audio_dir
+        self.audio_format = audio_format
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.pack_file = os.path.join(audio_dir, "audio.pack")
+        self.index_file = os.path.join(audio_dir, "audio.index.json")
+        self.journal_file = os.path.join(audio_dir, "audio.journal")
+        self.mm = None
+        self.dirty = 0
+        self.last_flush = time.time()
+        self.index = {"version": 1, "sentences": {}, "blobs": {}}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        self.replay_journal()
+
+    @property
+    def sentences(self):
+        return self.index["sentences"]
+
+    @property
+    def blobs(self):
+        return self.index["blobs"]
+
+    def replay_journal(self):
+        """把上次未写入索引的音频记录合并回来"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的行
+                self.blobs[record["key"]] = record["blob"]
+                if record["name"] in self.sentences:
+                    self.sentences[record["name"]]["audio"] = record["key"]
+                self.dirty += 1
+
+    def save_index(self):
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, self.index_file)
+        # 索引已包含日志中的全部记录
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.dirty = 0
+        self.last_flush = time.time()
+
+    def flush(self):
+        """把尚未写入的修改保存到索引"""
+        if self.dirty:
+            self.save_index()
+
+    def changed(self):
+        self.dirty += 1
+        if self.dirty >= self.flush_every or time.time() - self.last_flush >= self.flush_interval:
+            self.save_index()
+
+    def set_sentences(self, sentences):
+        """用 [(名称, 文本)] 替换当前句子列表，文本未变的句子保留其音频"""
+        old = self.sentences
+        new = {}
+        for name, text in sentences:
+            entry = {"text": text, "audio": None}
+            if name in old and old[name]["text"] == text:
+                entry["audio"] = old[name]["audio"]
+            new[name] = entry
+        self.index["sentences"] = new
+        self.save_index()
+
+    def names(self, slide=None):
+        """按顺序返回句子名称，可只返回某一页的句子"""
+        names = sorted(self.sentences)
+        if slide is not None:
+            names = [n for n in names if n.startswith(f"slide-{slide:03d}-")]
+        return names
+
+    def text(self, name):
+        return self.sentences[name]["text"]
+
+    def audio_key(self, name):
+        entry = self.sentences.get(name)
+        if entry is None or entry["audio"] not in self.blobs:
+            return None
+        return entry["audio"]
+
+    def duration(self, name):
+        key = self.audio_key(name)
+        return self.blobs[key]["duration"] if key else None
+
+    def has_audio(self, key):
+        return key in self.blobs
+
+    def link(self, name, key):
+        """让句子引用已存在的音频（例如句子顺序调整后）"""
+        if self.sentences[name]["audio"] != key:
+            self.sentences[name]["audio"] = key
+            self.changed()
+
+    def close(self):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass  # 仍有数组引用这块映射，交给垃圾回收
+            self.mm = None
+
+    def open_map(self):
+        if self.mm is None:
+            with open(self.pack_file, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm
+
+    def put_audio(self, name, key, data, sample_rate, meta=None):
+        """保存一句音频（int16 数组）并把句子指向它，meta 为需要记录的合成设置"""
+        data = np.asarray(data, dtype=np.int16)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if self.audio_format == "flac":
+            import soundfile as sf
+            buffer = io.BytesIO()
+            sf.write(buffer, data, sample_rate, format="FLAC", subtype="PCM_16")
+            payload = buffer.getvalue()
+        else:
+            payload = np.ascontiguousarray(data).tobytes()
+
+        # 写入前释放映射，Windows 上映射中的文件不能扩展
+        self.close()
+        with open(self.pack_file, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(payload)
+        blob = {
+            "offset": offset,
+            "size": len(payload),
+            "format": self.audio_format,
+            "sample_rate": sample_rate,
+            "channels": data.shape[1],
+            "frames": data.shape[0],
+            "duration": data.shape[0] / sample_rate,
+        }
+        if meta:
+            blob.update(meta)
+        self.blobs[key] = blob
+        if name in self.sentences:
+            self.sentences[name]["audio"] = key
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"name": name, "key": key, "blob": blob}) + "\n")
+        self.changed()
+
+    def put_wav(self, name, key, wav_file, meta=None):
+        import soundfile as sf
+        data, sample_rate = sf.read(wav_file, dtype="int16", always_2d=True)
+        self.put_audio(name, key, data, sample_rate, meta)
+
+    def read_slice(self, name, start, frames):
+        """读取一句音频中从 start 开始的 frames 帧，pcm 格式直接引用内存映射，flac 只解码需要的部分"""
+        key = self.audio_key(name)
+        if key is None:
+            raise KeyError(f"No audio stored for {name}")
+        blob = self.blobs[key]
+        start = min(max(start, 0), blob["frames"])
+        frames = min(frames, blob["frames"] - start)
+        mm = self.open_map()
+        if blob["format"] == "pcm":
+            channels = blob["channels"]
+            data = np.frombuffer(mm, dtype=np.int16, count=frames * channels,
+                                 offset=blob["offset"] + start * channels * 2)
+            return data.reshape(-1, channels)
+        import soundfile as sf
+        with sf.SoundFile(io.BytesIO(mm[blob["offset"]:blob["offset"] + blob["size"]])) as f:
+            f.seek(start)
+            return f.read(frames, dtype="int16", always_2d=True)
+
+    def stats(self):
+        pack_size = os.path.getsize(self.pack_file) if os.path.exists(self.pack_file) else 0
+        live = {e["audio"] for e in self.sentences.values() if e["audio"] in self.blobs}
+        live_bytes = sum(self.blobs[k]["size"] for k in live)
+        return {
+            "sentences": len(self.sentences),
+            "with_audio": sum(1 for n in self.sentences if self.audio_key(n)),
+            "blobs": len(self.blobs),
+            "duration_seconds": sum(self.blobs[k]["duration"] for k in live),
+            "pack_bytes": pack_size,
+            "live_bytes": live_bytes,
+            "dead_bytes": pack_size - live_bytes,
+        }
+
+    def compact(self):
+        """重写打包文件，只保留当前句子引用的音频"""
+        if not os.path.exists(self.pack_file):
+            return
+        live = {e["audio"] for e in self.sentences.values() if e["audio"] in self.blobs}
+        self.close()
+        tmp_file = self.pack_file + ".tmp"
+        blobs = {}
+        with open(self.pack_file, "rb") as src, open(tmp_file, "wb") as dst:
+            for key in sorted(live, key=lambda k: self.blobs[k]["offset"]):
+                blob = dict(self.blobs[key])
+                src.seek(blob["offset"])
+                payload = src.read(blob["size"])
+                blob["offset"] = dst.tell()
+                dst.write(payload)
+                blobs[key] = blob
+        os.replace(tmp_file, self.pack_file)
+        self.index["blobs"] = blobs
+        self.save_index()
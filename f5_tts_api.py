@@ -86,6 +86,9 @@ class F5TTS:
     def transcribe(self, ref_audio, language=None):
         return transcribe(ref_audio, language)
 
+    def prepare_ref(self, ref_file, ref_text):
+        return preprocess_ref_audio_text(ref_file, ref_text, device=self.device)
+
     def export_wav(self, wav, file_wave, remove_silence=False):
         sf.write(file_wave, wav, self.target_sample_rate)
 
@@ -113,13 +116,15 @@ class F5TTS:
         file_wave=None,
         file_spec=None,
         seed=None,
+        preprocess_ref=True,
     ):
         if seed is None:
             seed = random.randint(0, sys.maxsize)
         seed_everything(seed)
         self.seed = seed
 
-        ref_file, ref_text = preprocess_ref_audio_text(ref_file, ref_text, device=self.device)
+        if preprocess_ref:
+            ref_file, ref_text = self.prepare_ref(ref_file, ref_text)
 
         wav, sr, spec = infer_process(
             ref_file,
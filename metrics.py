@@ -0,0 +1,227 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource  # Windows 上没有该模块
+except ImportError:
+    resource = None
+
+
+class ProgressStream:
+    """包装 stdout：输出新行前先清除 stderr 上的进度行，输出完整一行后重绘进度"""
+
+    def __init__(self, stream, metrics):
+        self.stream = stream
+        self.metrics = metrics
+        self.line_start = True
+
+    def write(self, text):
+        if text and self.line_start:
+            sys.stderr.write("\r\x1b[2K")
+            sys.stderr.flush()
+        result = self.stream.write(text)
+        if text:
+            self.line_start = text.endswith("\n")
+            if self.line_start:
+                self.stream.flush()
+                self.metrics.show_progress(force=True)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class SilentProgress:
+    """代替 tqdm 模块传给 F5-TTS，开启进度行时不再为每句绘制进度条"""
+
+    @staticmethod
+    def tqdm(iterable, *args, **kwargs):
+        return iterable
+
+
+class Metrics:
+    """长时间转换任务的进度与指标，可通过 HTTP (Prometheus / JSON) 或终端进度行查看"""
+
+    def __init__(self, prefix="ttv"):
+        self.prefix = prefix
+        self.start_time = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.timestamps = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.progress_enabled = False
+        self.progress_interval = 0.5
+        self.last_progress = 0.0
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.show_progress()
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+        self.show_progress()
+
+    def mark(self, name):
+        """记录某个事件的时间点（不直接导出，用于计算派生指标）"""
+        with self.lock:
+            self.timestamps[name] = time.time()
+
+    def get(self, name, default=0):
+        with self.lock:
+            if name in self.counters:
+                return self.counters[name]
+            return self.gauges.get(name, default)
+
+    def peak_rss_bytes(self):
+        """进程峰值常驻内存（字节），无法获取时返回 None"""
+        if resource is not None:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux 单位是 KB，macOS 是字节
+            return rss if sys.platform == "darwin" else rss * 1024
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+
+    def snapshot(self):
+        """返回所有指标及派生指标"""
+        with self.lock:
+            data = dict(self.gauges)
+            data.update(self.counters)
+            timestamps = dict(self.timestamps)
+        now = time.time()
+        elapsed = now - self.start_time
+        data["elapsed_seconds"] = elapsed
+
+        if "tts_sentences" in data:
+            done = data.get("tts_sentences_synthesized", 0) + data.get("tts_cache_hits", 0)
+            data["tts_sentences_pending"] = max(data["tts_sentences"] - done - data.get("tts_errors", 0), 0)
+
+        # 按墙钟时间计算吞吐，多个远程节点并行时反映总吞吐；停滞时比值会持续下降
+        if "tts_started" in timestamps:
+            end = timestamps.get("tts_finished", now)
+            wall = end - timestamps["tts_started"]
+            if wall > 0:
+                data["tts_audio_seconds_per_wall_second"] = data.get("tts_audio_seconds", 0) / wall
+            if "tts_finished" not in timestamps:
+                last = timestamps.get("tts_sentence_completed", timestamps["tts_started"])
+                data["tts_seconds_since_last_sentence"] = now - last
+        lookups = data.get("tts_cache_hits", 0) + data.get("tts_cache_misses", 0)
+        if lookups:
+            data["tts_cache_hit_rate"] = data.get("tts_cache_hits", 0) / lookups
+
+        rss = self.peak_rss_bytes()
+        if rss is not None:
+            data["peak_rss_bytes"] = rss
+        return data
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        lines = []
+        for name, value in sorted(self.snapshot().items()):
+            if not isinstance(value, (int, float)):
+                continue
+            metric = f"{self.prefix}_{name}"
+            kind = "counter" if name in self.counters else "gauge"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port, host="127.0.0.1"):
+        """在后台线程启动指标服务：/metrics 为 Prometheus 格式，/metrics.json 为 JSON"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = metrics.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        print(f"Metrics available at http://{host}:{self.server.server_port}/metrics")
+        return self.server
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def enable_progress(self, interval=0.5):
+        """仅在终端中启用单行进度显示"""
+        self.progress_enabled = sys.stderr.isatty()
+        self.progress_interval = interval
+        if self.progress_enabled and not isinstance(sys.stdout, ProgressStream):
+            sys.stdout = ProgressStream(sys.stdout, self)
+
+    def format_progress(self):
+        data = self.snapshot()
+        elapsed = int(data["elapsed_seconds"])
+        parts = [f"[{elapsed // 3600:02d}:{elapsed // 60 % 60:02d}:{elapsed % 60:02d}]"]
+        if "startup_seconds" in data:
+            parts.append(f"startup {data['startup_seconds']:.2f}s")
+        if "tts_sentences" in data:
+            done = data.get("tts_sentences_synthesized", 0) + data.get("tts_cache_hits", 0)
+            parts.append(f"tts {done}/{data['tts_sentences']} pending {data['tts_sentences_pending']}")
+        if "tts_audio_seconds_per_wall_second" in data:
+            parts.append(f"{data['tts_audio_seconds_per_wall_second']:.2f}x")
+        if "tts_seconds_since_last_sentence" in data:
+            parts.append(f"last {data['tts_seconds_since_last_sentence']:.0f}s ago")
+        if "tts_cache_hit_rate" in data:
+            parts.append(f"cache {data['tts_cache_hit_rate']:.0%}")
+        if "video_slides" in data:
+            parts.append(f"slides {data.get('video_slides_processed', 0)}/{data['video_slides']}")
+        if data.get("video_frames"):
+            parts.append(f"frames {data.get('video_frames_encoded', 0)}/{data['video_frames']}")
+        if "video_encode_fps" in data:
+            parts.append(f"enc {data['video_encode_fps']:.1f}fps")
+        if "peak_rss_bytes" in data:
+            parts.append(f"rss {data['peak_rss_bytes'] / 2**20:.0f}MB")
+        return " | ".join(parts)
+
+    def show_progress(self, force=False):
+        if not self.progress_enabled:
+            return
+        now = time.time()
+        if not force and now - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = now
+        sys.stderr.write("\r\x1b[2K" + self.format_progress() + "\r")
+        sys.stderr.flush()
+
+    def finish_progress(self):
+        if self.progress_enabled:
+            self.show_progress(force=True)
+            sys.stderr.write(os.linesep)
+            sys.stderr.flush()
+            if isinstance(sys.stdout, ProgressStream):
+                sys.stdout = sys.stdout.stream
+
+
+metrics = Metrics()
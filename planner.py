@@ -0,0 +1,193 @@
+import contextlib
+import io
+import json
+import os
+import time
+
+# 没有历史记录时使用的默认参数
+DEFAULT_SECONDS_PER_CHAR = {"zh": 0.22, "en": 0.065}
+DEFAULT_SECONDS_PER_SENTENCE = 0.3
+DEFAULT_SYNTH_PER_AUDIO_SECOND = 0.2
+DEFAULT_SYNTH_PER_SENTENCE = 0.5
+DEFAULT_ENCODE_FPS = 60.0
+VIDEO_FPS = 24
+SILENT_SLIDE_SECONDS = 2
+REFERENCE_NFE_STEP = 32
+REFERENCE_CFG_STRENGTH = 2
+
+
+def record_trace(trace_file, record):
+    """向运行记录追加一条 JSON 行，用于拟合成本模型"""
+    if not trace_file:
+        return
+    record = dict(record, time=time.time())
+    with open(trace_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_trace(trace_file):
+    records = []
+    if not trace_file or not os.path.exists(trace_file):
+        return records
+    with open(trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def fit_linear(xs, ys):
+    """最小二乘拟合 y = a*x + b，数据不足或结果不合理时返回 None"""
+    n = len(xs)
+    if n < 2:
+        return None
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    a = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    b = mean_y - a * mean_x
+    if a <= 0:
+        return None
+    if b < 0:
+        # 截距为负时退化为过原点的比例模型
+        return sum(ys) / sum(xs), 0.0
+    return a, b
+
+
+def step_cost(nfe_step, cfg_strength):
+    """相对 32 步、开启 CFG 时的计算量：每步一次模型前向，CFG 需要额外一次"""
+    passes = 2 if cfg_strength > 0 else 1
+    return nfe_step * passes / (REFERENCE_NFE_STEP * 2)
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class CostModel:
+    """根据历史运行记录预测旁白时长、TTS 计算时间和编码时间"""
+
+    def __init__(self, trace_file="trace.jsonl"):
+        self.records = load_trace(trace_file)
+
+    def tts_records(self, lang=None):
+        return [r for r in self.records
+                if r.get("stage") == "tts" and (lang is None or r.get("lang") == lang)]
+
+    def narration_model(self, lang):
+        """返回 (每字符秒数, 每句秒数)，按语速 1.0 归一化"""
+        records = self.tts_records(lang)
+        # F5-TTS 的时长与语速成反比，统一换算到 speed=1.0 后再拟合
+        fit = fit_linear([r["chars"] for r in records],
+                         [r["audio_seconds"] * r.get("speed", 1.0) for r in records])
+        if fit is None:
+            return DEFAULT_SECONDS_PER_CHAR.get(lang, DEFAULT_SECONDS_PER_CHAR["en"]), DEFAULT_SECONDS_PER_SENTENCE
+        return fit
+
+    def synthesis_model(self):
+        """返回 (每秒音频的计算秒数, 每句固定开销)，按 32 步、开启 CFG 归一化"""
+        records = self.tts_records()
+        # 计算量与扩散步数以及每步的模型前向次数成正比
+        fit = fit_linear([r["audio_seconds"] * step_cost(r.get("nfe_step", REFERENCE_NFE_STEP),
+                                                         r.get("cfg_strength", REFERENCE_CFG_STRENGTH)) for r in records],
+                         [r["synth_seconds"] for r in records])
+        if fit is None:
+            return DEFAULT_SYNTH_PER_AUDIO_SECOND, DEFAULT_SYNTH_PER_SENTENCE
+        return fit
+
+    def encode_fps(self):
+        records = [r for r in self.records if r.get("stage") == "encode" and r.get("encode_seconds")]
+        if not records:
+            return DEFAULT_ENCODE_FPS
+        frames = sum(r["video_seconds"] for r in records) * VIDEO_FPS
+        return frames / sum(r["encode_seconds"] for r in records)
+
+    def narration_seconds(self, chars, lang, speed):
+        per_char, per_sentence = self.narration_model(lang)
+        return (per_char * chars + per_sentence) / speed
+
+    def predict(self, tts, workers=1):
+        """对一个 Text2Speech 实例做预测，返回结果字典"""
+        per_audio, per_sentence = self.synthesis_model()
+        slide_seconds = {}
+        sentences = tts.sentences()
+        cache_hits = 0
+        narration = 0.0
+        compute = 0.0
+        for name, text in sentences:
+            duration = tts.cached_duration(text)
+            if duration is not None:
+                cache_hits += 1
+            else:
+                duration = self.narration_seconds(tts.count_chars(text), tts.lang, tts.speed)
+                nfe_step, cfg_strength = tts.step_settings(text)
+                compute += per_audio * duration * step_cost(nfe_step, cfg_strength) + per_sentence
+            narration += duration
+            slide = int(name.split("-")[1])
+            slide_seconds[slide] = slide_seconds.get(slide, 0.0) + duration
+
+        # 与 PPT2Video 一致：第一页和无旁白的页面为 2 秒无声片段
+        video = 0.0
+        for i in range(len(tts.prs.slides)):
+            if i == 0 or i not in slide_seconds:
+                video += SILENT_SLIDE_SECONDS
+            else:
+                video += slide_seconds[i]
+
+        tts_seconds = compute / max(workers, 1)
+        encode_seconds = video * VIDEO_FPS / self.encode_fps()
+        return {
+            "slides": len(tts.prs.slides),
+            "sentences": len(sentences),
+            "cache_hits": cache_hits,
+            "narration_seconds": narration,
+            "video_seconds": video,
+            "tts_seconds": tts_seconds,
+            "encode_seconds": encode_seconds,
+            "total_seconds": tts_seconds + encode_seconds,
+            "workers": workers,
+            "trace_records": len(self.records),
+        }
+
+
+def load_for_plan(input_file, lang, template=None, max_leaf_count=8, config_file="config.yaml"):
+    """只运行廉价阶段（Word 索引、备注提取），返回 Text2Speech 实例"""
+    from text2speech import Text2Speech
+    if input_file.lower().endswith(".docx"):
+        if not template:
+            raise ValueError("A template PPT file is required to plan a Word document")
+        from word2pptx import Word2PPTX
+        buffer = io.BytesIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            prs = Word2PPTX(input_file, None, template, max_leaf_count).build()
+        prs.save(buffer)
+        buffer.seek(0)
+        return Text2Speech(buffer, lang, config_file)
+    return Text2Speech(input_file, lang, config_file)
+
+
+def balance(plans, slots):
+    """按预测耗时把任务分配到若干执行槽（最长处理时间优先），返回每个槽的任务列表"""
+    assignment = [[] for _ in range(max(slots, 1))]
+    loads = [0.0] * len(assignment)
+    for plan in sorted(plans, key=lambda p: p["total_seconds"], reverse=True):
+        slot = loads.index(min(loads))
+        assignment[slot].append(plan)
+        loads[slot] += plan["total_seconds"]
+    return assignment
+
+
+def print_plan(plan):
+    print(f"{plan['input']}:")
+    print(f"  Slides: {plan['slides']}, sentences: {plan['sentences']}, cache hits: {plan['cache_hits']}")
+    print(f"  Narration: {format_seconds(plan['narration_seconds'])}, video length: {format_seconds(plan['video_seconds'])}")
+    print(f"  TTS compute ({plan['workers']} worker(s)): {format_seconds(plan['tts_seconds'])}, "
+          f"encode: {format_seconds(plan['encode_seconds'])}, total: {format_seconds(plan['total_seconds'])}")
@@ -1,10 +1,13 @@
 import os
 import yaml
+import numpy as np
 from pptx import Presentation
-from moviepy import ImageClip, AudioFileClip, concatenate_videoclips, concatenate_audioclips
-import win32com.client  # 需要 pywin32: pip install pywin32
 import shutil
+import time
 from datetime import timedelta
+from audio_store import AudioStore
+from metrics import metrics
+from planner import record_trace
 
 class PPT2Video:
     def __init__(self, ppt_file, video_file, config_file="config.yaml"):
@@ -18,6 +21,8 @@ class PPT2Video:
         with open(config_file, 'r', encoding='utf-8') as f:
             config = yaml.safe_load(f)
         self.audio_dir = config.get('output_dir', 'audio')
+        self.trace_file = config.get('trace_file', 'trace.jsonl')
+        self.store = AudioStore(self.audio_dir, config.get('audio_format', 'flac'))
         self.temp_dir = os.path.join(self.audio_dir, "temp_slides")  # 临时目录使用 audio_dir/temp_slides
 
     def export_slides_to_images(self):
@@ -26,6 +31,7 @@ class PPT2Video:
             shutil.rmtree(self.temp_dir)
         os.makedirs(self.temp_dir)
 
+        import win32com.client  # 需要 pywin32: pip install pywin32
         powerpoint = win32com.client.Dispatch("PowerPoint.Application")
         presentation = powerpoint.Presentations.Open(os.path.abspath(self.ppt_file))
         
@@ -47,6 +53,46 @@ class PPT2Video:
         
         return slide_images
     
+    def audio_clip(self, name):
+        """按需从音频包读取一句音频的 moviepy 音频片段，只转换 moviepy 请求的那一段"""
+        from moviepy import AudioClip
+        blob = self.store.blobs[self.store.audio_key(name)]
+        sample_rate = blob["sample_rate"]
+        last = blob["frames"] - 1
+
+        def frame_function(t):
+            idx = np.clip(np.rint(np.atleast_1d(t) * sample_rate).astype(np.int64), 0, last)
+            start = int(idx.min())
+            chunk = self.store.read_slice(name, start, int(idx.max()) - start + 1)
+            frames = chunk[idx - start].astype(np.float32) / 32768.0
+            return frames if np.ndim(t) else frames[0]
+
+        return AudioClip(frame_function, duration=blob["duration"], fps=sample_rate)
+
+    def encode_logger(self):
+        """编码过程中持续更新已编码帧数和编码帧率的 proglog 记录器"""
+        from proglog import ProgressBarLogger, TqdmProgressBarLogger
+        # 启用终端进度行时不再显示 moviepy 自带的进度条
+        base = ProgressBarLogger if metrics.progress_enabled else TqdmProgressBarLogger
+
+        class EncodeLogger(base):
+            start = None
+
+            def bars_callback(self, bar, attr, value, old_value=None):
+                super().bars_callback(bar, attr, value, old_value)
+                if bar != "frame_index" or attr != "index":
+                    return
+                if self.start is None:
+                    self.start = time.time()
+                frames = value  # 第 value 帧开始写入时，之前的帧已完成
+                metrics.set("video_frames_encoded", frames)
+                metrics.set("video_frames", self.bars[bar].get("total") or 0)
+                elapsed = time.time() - self.start
+                if elapsed > 0:
+                    metrics.set("video_encode_fps", frames / elapsed)
+
+        return EncodeLogger()
+
     def str_time(self, seconds):
         td = timedelta(seconds=seconds)
         h = td.seconds//3600
@@ -66,6 +112,7 @@ class PPT2Video:
     
     def convert(self):
         """将PPT和音频合成为1080p视频，并生成字幕文件"""
+        from moviepy import ImageClip, concatenate_videoclips, concatenate_audioclips
         slide_images = self.export_slides_to_images()
         
         if len(slide_images) != len(self.prs.slides):
@@ -75,9 +122,11 @@ class PPT2Video:
         clips = []
         srt_entries = []
         total_time = 0  # 用于计算字幕时间
+        metrics.set("video_slides", len(self.prs.slides))
         
         for i, slide in enumerate(self.prs.slides):
             print(f"Processing slide {i}")
+            metrics.set("video_slides_processed", i)
             img_file = slide_images[i]
             
             # 第一页特殊处理：2秒无声视频
@@ -88,28 +137,20 @@ class PPT2Video:
                 total_time += self.default_duration
                 continue
             
-            # 查找该页的文本和音频文件
-            text_files = sorted(
-                [f for f in os.listdir(self.audio_dir) if f.startswith(f"slide-{i:03d}-") and f.endswith(".txt")],
-                key=lambda x: int(x.split('-')[2].split('.')[0])
-            )
-            audio_files = sorted(
-                [f for f in os.listdir(self.audio_dir) if f.startswith(f"slide-{i:03d}-") and f.endswith(".wav")],
-                key=lambda x: int(x.split('-')[2].split('.')[0])
-            )
-            
-            # 检查文本和音频是否匹配
-            if len(text_files) != len(audio_files):
-                print(f"Error: Mismatch between text files ({len(text_files)}) and audio files ({len(audio_files)}) for slide {i}")
+            # 从音频包中读取该页的句子和音频
+            names = self.store.names(i)
+            missing = [n for n in names if self.store.audio_key(n) is None]
+            if missing:
+                print(f"Error: Missing audio for {len(missing)} of {len(names)} sentences for slide {i}, e.g. {missing[0]}")
                 return
             
-            if not text_files:  # 无文本和音频
+            if not names:  # 无文本和音频
                 clip = ImageClip(img_file, duration=self.default_duration).resized(width=self.resolution[0], height=self.resolution[1])
                 clips.append(clip)
                 print(f"  Created 2-second silent clip for slide {i}, start: {total_time:.2f}s, end: {total_time + self.default_duration:.2f}s")
                 total_time += self.default_duration
             else:  # 有文本和音频
-                audio_clips = [AudioFileClip(os.path.join(self.audio_dir, af)) for af in audio_files]
+                audio_clips = [self.audio_clip(n) for n in names]
                 total_duration = sum(ac.duration for ac in audio_clips)
                 combined_audio = concatenate_audioclips(audio_clips)
                 
@@ -120,28 +161,42 @@ class PPT2Video:
                 
                 # 生成字幕并打印时间信息
                 current_time = total_time
-                for j, (txt_file, audio_clip) in enumerate(zip(text_files, audio_clips)):
-                    with open(os.path.join(self.audio_dir, txt_file), 'r', encoding='utf-8') as f:
-                        text = f.read().strip()
+                for j, (name, audio_clip) in enumerate(zip(names, audio_clips)):
+                    text = self.store.text(name).strip()
                     srt_entry = f"{len(srt_entries) + 1}\n"
                     srt_entry += f"{self.generate_srt_time(current_time, audio_clip.duration)}\n"
                     srt_entry += f"{text}\n\n"
                     srt_entries.append(srt_entry)
-                    print(f"    Added text/audio {txt_file}: start {current_time:.2f}s, end {current_time + audio_clip.duration:.2f}s, duration {audio_clip.duration:.2f}s")
+                    print(f"    Added text/audio {name}: start {current_time:.2f}s, end {current_time + audio_clip.duration:.2f}s, duration {audio_clip.duration:.2f}s")
                     current_time += audio_clip.duration
                 
                 total_time += total_duration
         
+        metrics.set("video_slides_processed", len(self.prs.slides))
+        metrics.set("video_duration_seconds", total_time)
+        
         if clips:
             final_video = concatenate_videoclips(clips)
+            fps = 24
+            start = time.time()
             final_video.write_videofile(
                 self.video_file,
-                fps=24,
+                fps=fps,
                 codec="libx264",
                 bitrate="5000k",
                 preset="medium",
-                audio_codec="aac"
+                audio_codec="aac",
+                logger=self.encode_logger(),
             )
+            encode_seconds = time.time() - start
+            metrics.set("video_encode_seconds", encode_seconds)
+            if encode_seconds > 0:
+                metrics.set("video_encode_fps", final_video.duration * fps / encode_seconds)
+            record_trace(self.trace_file, {
+                "stage": "encode",
+                "video_seconds": final_video.duration,
+                "encode_seconds": encode_seconds,
+            })
             print(f"Video saved as {self.video_file} (1080p)")
             
             srt_file = os.path.join(self.audio_dir, os.path.splitext(os.path.basename(self.video_file))[0] + ".srt")
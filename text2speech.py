@@ -1,12 +1,21 @@
 import os
+import hashlib
+import io
+import json
+import tempfile
 import yaml
 from pptx import Presentation
 import subprocess
 import re
-from f5_tts_api import F5TTS
+import time
+from adaptive_steps import StepScheduler, DEFAULT_NFE_STEP, DEFAULT_CFG_STRENGTH, calibrate
+from audio_store import AudioStore
+from metrics import metrics, SilentProgress
+from planner import record_trace
+from voice_prompt import VoicePrompt
 
 class Text2Speech:
-    def __init__(self, ppt_file, lang="zh", config_file="config.yaml"):
+    def __init__(self, ppt_file, lang="zh", config_file="config.yaml", workers=None):
         self.ppt_file = ppt_file
         self.lang = lang.lower()
         self.prs = Presentation(ppt_file)
@@ -24,9 +33,22 @@ class Text2Speech:
         self.target_rms = config.get('target_rms', 0.1)
         self.remove_silence = config.get('remove_silence', True)
         self.audio_dir = config.get('output_dir', 'audio')        
+        self.trace_file = config.get('trace_file', 'trace.jsonl')
+        self.audio_format = config.get('audio_format', 'flac')
+        self.workers = workers if workers is not None else config.get('tts_workers') or []
+        self.calibration_file = config.get('nfe_calibration', 'tts/nfe_calibration.json')
+        self.nfe_budget = config.get('nfe_budget', 3.0)
+        self.steps = StepScheduler(
+            nfe_step=config.get('nfe_step', DEFAULT_NFE_STEP),
+            cfg_strength=config.get('cfg_strength', DEFAULT_CFG_STRENGTH),
+            adaptive=config.get('adaptive_steps', False),
+            calibration_file=self.calibration_file,
+            skip_cfg=config.get('adaptive_skip_cfg', False),
+        )
         
         if not os.path.exists(self.audio_dir):
             os.makedirs(self.audio_dir)
+        self.store = AudioStore(self.audio_dir, self.audio_format)
 
         if self.lang == "zh":
             self.ref_audio = self.ref_zh_audio
@@ -36,6 +58,22 @@ class Text2Speech:
             self.ref_text = self.ref_en_text
         else:
             raise ValueError("Language must be 'zh' or 'en'")
+        # 保留原始参考，裁剪总是从原始参考开始
+        self.source_ref_audio = self.ref_audio
+        self.source_ref_text = self.ref_text
+
+        self.prompt = VoicePrompt(
+            prepared_dir=config.get('prepared_prompt_dir', 'tts/prepared'),
+            target_seconds=config.get('ref_target_seconds', 8.0),
+        )
+        if config.get('trim_reference', False) and os.path.exists(self.ref_audio):
+            self.prepare_reference()
+
+    def prepare_reference(self, gen_seconds=3.0):
+        """裁剪参考音频并对齐参考文本，之后所有句子都使用准备好的参考"""
+        self.ref_audio, self.ref_text, report = self.prompt.prepare(self.source_ref_audio, self.source_ref_text, gen_seconds)
+        metrics.set("tts_ref_prompt_seconds", report["prepared_seconds"])
+        return report
 
     def split_sentence(self, sentence):
         punctuation = r'[.,!?;:。，！？；：]'
@@ -75,11 +113,12 @@ class Text2Speech:
         punctuation = r'[.,!?;:。，！？；：]'
         return re.sub(punctuation, '', text)
 
-    def generate_text_files(self):
+    def sentences(self):
+        """从备注中提取句子，返回 [(名称, 文本)]，名称形如 slide-XXX-YYY"""
+        result = []
         for i, slide in enumerate(self.prs.slides):
             text = slide.notes_slide.notes_text_frame.text.strip()
             if not text:
-                print(f"No notes found for slide {i}, skipping text file generation")
                 continue
             
             lines = self.split_text(text)
@@ -88,40 +127,207 @@ class Text2Speech:
             for idx, l in enumerate(processed_lines):
                 if not self.remove_punctuation(l.strip()):
                     continue
-                ii = f"{i:03}"
-                idxs = f"{idx:03}"
-                txt_file = os.path.join(self.audio_dir, f"slide-{ii}-{idxs}.txt")
-                with open(txt_file, 'w', encoding='utf-8') as f:
-                    f.write(l)
-                print(f"Generated text file for slide {i}: {txt_file}")
+                result.append((f"slide-{i:03}-{idx:03}", l))
+        return result
+
+    def count_chars(self, text):
+        """用于时长估计的有效字符数（不含标点和空白）"""
+        return len(re.sub(r'\s', '', self.remove_punctuation(text)))
+
+    def step_settings(self, text):
+        """返回该句使用的 (nfe_step, cfg_strength)"""
+        return self.steps.choose(self.count_chars(text))
+
+    def cache_key(self, text):
+        """句子音频的缓存键，任何影响合成结果的设置变化都会使缓存失效"""
+        ref_stat = None
+        if os.path.exists(self.ref_audio):
+            st = os.stat(self.ref_audio)
+            ref_stat = [st.st_size, int(st.st_mtime)]
+        settings = {
+            "text": text,
+            "ref_audio": self.ref_audio,
+            "ref_stat": ref_stat,
+            "ref_text": self.ref_text,
+            "model": self.model,
+            "speed": self.speed,
+            "target_rms": self.target_rms,
+            "remove_silence": self.remove_silence,
+        }
+        nfe_step, cfg_strength = self.step_settings(text)
+        # 默认设置不写入缓存键，保持已有缓存有效
+        if nfe_step != DEFAULT_NFE_STEP or cfg_strength != DEFAULT_CFG_STRENGTH:
+            settings["nfe_step"] = nfe_step
+            settings["cfg_strength"] = cfg_strength
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def is_cached(self, text):
+        return self.store.has_audio(self.cache_key(text))
+
+    def cached_duration(self, text):
+        """已缓存句子的音频时长，未缓存时返回 None"""
+        key = self.cache_key(text)
+        if not self.store.has_audio(key):
+            return None
+        return self.store.blobs[key]["duration"]
+
+    def generate_sentences(self):
+        sentences = self.sentences()
+        self.store.set_sentences(sentences)
+        metrics.set("tts_sentences_stored", len(sentences))
+        print(f"Stored {len(sentences)} sentences in {self.store.index_file}")
+
+    def record_audio(self, name, text, synth_seconds):
+        """记录新生成的音频：运行记录和指标"""
+        duration = self.store.duration(name)
+        nfe_step, cfg_strength = self.step_settings(text)
+        record_trace(self.trace_file, {
+            "stage": "tts",
+            "lang": self.lang,
+            "speed": self.speed,
+            "chars": self.count_chars(text),
+            "nfe_step": nfe_step,
+            "cfg_strength": cfg_strength,
+            "audio_seconds": duration,
+            "synth_seconds": synth_seconds,
+        })
+        metrics.inc("tts_synthesis_seconds", synth_seconds)
+        metrics.inc("tts_audio_seconds", duration)
+        metrics.mark("tts_sentence_completed")
+        metrics.inc("tts_sentences_synthesized")
 
     def generate_audio(self):
-        txt_files = []
-        for file in os.listdir(self.audio_dir):
-            if file.endswith(".txt"):
-                txt_files.append(file)
-        
+        names = self.store.names()
+        metrics.set("tts_sentences", len(names))
+        jobs = []
+        for name in names:
+            s = self.store.text(name)
+            if self.is_cached(s):
+                self.store.link(name, self.cache_key(s))
+                metrics.inc("tts_cache_hits")
+                print(f"Cached audio: {name}")
+                continue
+            metrics.inc("tts_cache_misses")
+            jobs.append({"name": name, "text": s})
+
+        metrics.mark("tts_started")
+        if jobs and self.workers:
+            self.generate_audio_remote(jobs)
+        elif jobs:
+            self.generate_audio_local(jobs)
+        else:
+            self.store.flush()  # 只有缓存命中时保存重新链接的句子
+        metrics.mark("tts_finished")
+        metrics.set("tts_queue_depth", 0)
+
+    def generate_audio_local(self, jobs):
+        # 只有真正需要合成时才加载模型（torch、f5_tts 导入很慢）
+        start = time.time()
+        import tqdm
+        from f5_tts_api import F5TTS
         f5tts = F5TTS()
-        for file in txt_files:
-            txt_file = os.path.join(self.audio_dir, file)
-            audio_file = txt_file[:-3] + 'wav'
-            with open(txt_file, "r", encoding="utf-8") as f:
-                s = f.read()
+        metrics.set("tts_model_load_seconds", time.time() - start)
+        # F5-TTS 的逐句进度条会打乱终端进度行
+        progress = SilentProgress if metrics.progress_enabled else tqdm
+        fd, audio_file = tempfile.mkstemp(suffix=".wav", dir=self.audio_dir)
+        os.close(fd)
+        try:
+            for n, job in enumerate(jobs):
+                metrics.set("tts_queue_depth", len(jobs) - n)
+                try:
+                    nfe_step, cfg_strength = self.step_settings(job["text"])
+                    print(f"Text: {job['text']}, Audio: {job['name']}, NFE steps: {nfe_step}")
+                    start = time.time()
+                    f5tts.infer(
+                        ref_file = self.ref_audio,
+                        ref_text = self.ref_text,
+                        gen_text = job["text"],
+                        target_rms = self.target_rms,
+                        speed = self.speed,
+                        remove_silence= self.remove_silence,
+                        file_wave= audio_file,
+                        nfe_step= nfe_step,
+                        cfg_strength= cfg_strength,
+                        progress= progress,
+                    )
+                    synth_seconds = time.time() - start
+                    self.store.put_wav(job["name"], self.cache_key(job["text"]), audio_file,
+                                       {"nfe_step": nfe_step, "cfg_strength": cfg_strength})
+                    self.record_audio(job["name"], job["text"], synth_seconds)
+                except Exception as e:
+                    metrics.inc("tts_errors")
+                    print(f"Error generating audio: {e}")
+        finally:
+            self.store.flush()
+            os.remove(audio_file)
+
+    def generate_audio_remote(self, jobs):
+        """把句子分发到远程 TTS 工作节点"""
+        from tts_worker import RemoteTTSPool
+        for job in jobs:
+            nfe_step, cfg_strength = self.step_settings(job["text"])
+            job.update({
+                "nfe_step": nfe_step,
+                "cfg_strength": cfg_strength,
+                "lang": self.lang,
+                "ref_audio": self.ref_audio,
+                "ref_text": self.ref_text,
+                "target_rms": self.target_rms,
+                "speed": self.speed,
+                "remove_silence": self.remove_silence,
+            })
+
+        def on_result(job, data, synth_seconds, error, queued):
+            metrics.set("tts_queue_depth", queued)
+            if error is not None:
+                metrics.inc("tts_errors")
+                print(f"Error generating audio for {job['name']}: {error}")
+                return
             try:
-                print(f"Text file: {txt_file}, Audio file: {audio_file}")
-                f5tts.infer(
-                    ref_file = self.ref_audio,
-                    ref_text = self.ref_text,
-                    gen_text = s,
-                    target_rms = self.target_rms,
-                    speed = self.speed,
-                    remove_silence= self.remove_silence,
-                    file_wave= audio_file,
-                )
+                self.store.put_wav(job["name"], self.cache_key(job["text"]), io.BytesIO(data),
+                                   {"nfe_step": job["nfe_step"], "cfg_strength": job["cfg_strength"]})
+                print(f"Received audio: {job['name']}")
+                self.record_audio(job["name"], job["text"], synth_seconds)
             except Exception as e:
-                print(f"Error generating audio: {e.stderr}")
+                metrics.inc("tts_errors")
+                print(f"Error storing audio for {job['name']}: {e}")
+
+        print(f"Sending {len(jobs)} sentences to {len(self.workers)} TTS workers")
+        try:
+            RemoteTTSPool(self.workers).run(jobs, on_result)
+        finally:
+            self.store.flush()
+
+    def calibrate_steps(self, samples=24, seed=0):
+        """用当前文档的句子校准自适应步数，结果写入 nfe_calibration 文件"""
+        from f5_tts_api import F5TTS
+        f5tts = F5TTS()
+        sentences = sorted((self.count_chars(t), t) for _, t in self.sentences())
+        if len(sentences) > samples:
+            # 在长度分布上均匀取样
+            sentences = [sentences[i * len(sentences) // samples] for i in range(samples)]
+
+        def synthesize(text, nfe_step, cfg_strength):
+            wav, _, _ = f5tts.infer(
+                ref_file=self.ref_audio,
+                ref_text=self.ref_text,
+                gen_text=text,
+                target_rms=self.target_rms,
+                speed=self.speed,
+                nfe_step=nfe_step,
+                cfg_strength=cfg_strength,
+                seed=seed,
+            )
+            return wav
+
+        print(f"Calibrating NFE steps on {len(sentences)} sentences, budget {self.nfe_budget} dB")
+        result = calibrate(synthesize, sentences, self.nfe_budget, self.steps.nfe_step, self.steps.cfg_strength)
+        with open(self.calibration_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Calibration saved as {self.calibration_file}")
+        return result
 
     def convert(self):
-        """主流程：生成文本文件和音频"""
-        self.generate_text_files()
+        """主流程：生成句子和音频"""
+        self.generate_sentences()
         self.generate_audio()
\ No newline at end of file
@@ -0,0 +1,243 @@
+import http.client
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TTSWorker:
+    """TTS 工作节点：模型和参考音频只加载一次，通过 HTTP 接收句子并返回 wav
+
+    只读取 ref_dirs 目录下的参考音频，其他路径的请求返回 400。
+    """
+
+    def __init__(self, model="F5TTS_v1_Base", device=None, ref_dirs=("tts",)):
+        from f5_tts_api import F5TTS
+        self.f5tts = F5TTS(model=model, device=device)
+        self.ref_dirs = [os.path.realpath(d) for d in ref_dirs]
+        self.prompts = {}
+        self.lock = threading.Lock()  # 同一时间只在模型上跑一个推理
+        self.completed = 0
+        self.busy = False
+
+    def allowed_ref(self, ref_audio):
+        """参考音频必须是 ref_dirs 下已存在的文件"""
+        if not isinstance(ref_audio, str):
+            return False
+        path = os.path.realpath(ref_audio)
+        return os.path.isfile(path) and any(os.path.commonpath([path, d]) == d for d in self.ref_dirs)
+
+    def prompt(self, ref_audio, ref_text):
+        # 参考文件在节点上被替换后重新准备
+        st = os.stat(ref_audio)
+        key = (os.path.realpath(ref_audio), st.st_size, st.st_mtime_ns, ref_text)
+        if key not in self.prompts:
+            print(f"Preparing reference prompt: {ref_audio}")
+            self.prompts[key] = self.f5tts.prepare_ref(ref_audio, ref_text)
+        return self.prompts[key]
+
+    def synthesize(self, job):
+        """合成一个句子，返回 (wav 字节, 合成耗时)"""
+        fd, wav_file = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self.lock:
+                self.busy = True
+                try:
+                    ref_file, ref_text = self.prompt(job["ref_audio"], job["ref_text"])
+                    start = time.time()
+                    self.f5tts.infer(
+                        ref_file=ref_file,
+                        ref_text=ref_text,
+                        gen_text=job["text"],
+                        target_rms=job.get("target_rms", 0.1),
+                        speed=job.get("speed", 1.0),
+                        remove_silence=job.get("remove_silence", False),
+                        file_wave=wav_file,
+                        nfe_step=job.get("nfe_step", 32),
+                        cfg_strength=job.get("cfg_strength", 2),
+                        preprocess_ref=False,
+                    )
+                    synth_seconds = time.time() - start
+                    self.completed += 1
+                finally:
+                    self.busy = False
+            with open(wav_file, "rb") as f:
+                return f.read(), synth_seconds
+        finally:
+            os.remove(wav_file)
+
+    def health(self):
+        return {"status": "ok", "busy": self.busy, "completed": self.completed}
+
+    def serve(self, port, host="127.0.0.1"):
+        worker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_json(self, code, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self.send_json(200, worker.health())
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path != "/synthesize":
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                job = json.loads(self.rfile.read(length).decode("utf-8"))
+                if not worker.allowed_ref(job.get("ref_audio")):
+                    print(f"Rejected {job.get('name')}: reference audio outside {', '.join(worker.ref_dirs)}")
+                    self.send_json(400, {"error": "ref_audio must be a file under the worker's reference directories"})
+                    return
+                try:
+                    data, synth_seconds = worker.synthesize(job)
+                except Exception as e:
+                    print(f"Error generating audio for {job.get('name')}: {e}")
+                    self.send_json(500, {"error": str(e)})
+                    return
+                print(f"Synthesized {job.get('name')} in {synth_seconds:.2f}s")
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-Synth-Seconds", f"{synth_seconds:.6f}")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        print(f"TTS worker listening on http://{host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+class RemoteTTSPool:
+    """协调多个 TTS 工作节点：心跳检测、失败任务重新排队、结果按完成顺序回传"""
+
+    def __init__(self, workers, timeout=600, heartbeat_interval=5, max_retries=3,
+                 dead_timeout=120, concurrency=2):
+        self.workers = [w.rstrip("/") if w.startswith("http") else f"http://{w}" for w in workers]
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.max_retries = max_retries
+        self.dead_timeout = dead_timeout
+        # 每个节点保持多个请求在途，避免网络往返期间模型空闲
+        self.concurrency = concurrency
+        self.alive = {w: False for w in self.workers}
+        self.last_alive = time.time()
+        self.lock = threading.Lock()
+
+    def mark(self, worker, ok):
+        with self.lock:
+            if self.alive[worker] != ok:
+                print(f"TTS worker {worker} is {'up' if ok else 'down'}")
+            self.alive[worker] = ok
+            if ok:
+                self.last_alive = time.time()
+
+    def check(self, worker):
+        try:
+            with urllib.request.urlopen(f"{worker}/health", timeout=5) as resp:
+                ok = resp.status == 200
+        except (urllib.error.URLError, OSError, http.client.HTTPException):
+            ok = False
+        self.mark(worker, ok)
+        return ok
+
+    def heartbeat(self, stop):
+        while not stop.wait(self.heartbeat_interval):
+            for worker in self.workers:
+                self.check(worker)
+
+    def synthesize(self, worker, job):
+        payload = {k: v for k, v in job.items() if k != "attempts"}
+        request = urllib.request.Request(
+            f"{worker}/synthesize",
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            data = resp.read()
+            synth_seconds = float(resp.headers.get("X-Synth-Seconds", 0))
+        return data, synth_seconds
+
+    def worker_loop(self, worker, jobs, results, stop):
+        while not stop.is_set():
+            if not self.alive[worker]:
+                stop.wait(1)
+                continue
+            try:
+                job = jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                data, synth_seconds = self.synthesize(worker, job)
+                self.mark(worker, True)
+                results.put((job, data, synth_seconds, None))
+            except Exception as e:
+                # HTTPError 表示节点在线但合成失败；其他错误（连接断开、响应不完整等）视为节点丢失
+                if not isinstance(e, urllib.error.HTTPError):
+                    self.mark(worker, False)
+                job["attempts"] += 1
+                # 400 表示请求本身被拒绝，重试不会成功
+                rejected = isinstance(e, urllib.error.HTTPError) and e.code == 400
+                if rejected or job["attempts"] > self.max_retries:
+                    results.put((job, None, 0, e))
+                else:
+                    print(f"Retrying {job['name']} after error from {worker}: {e}")
+                    jobs.put(job)
+
+    def run(self, jobs, callback):
+        """分发任务，每完成一个句子调用 callback(job, wav 字节, 合成耗时, 错误, 排队中的任务数)"""
+        pending = queue.Queue()
+        for job in jobs:
+            job.setdefault("attempts", 0)
+            pending.put(job)
+        results = queue.Queue()
+        stop = threading.Event()
+
+        for worker in self.workers:
+            self.check(worker)
+        self.last_alive = time.time()
+        threads = [threading.Thread(target=self.heartbeat, args=(stop,), daemon=True)]
+        for worker in self.workers:
+            for _ in range(self.concurrency):
+                threads.append(threading.Thread(target=self.worker_loop, args=(worker, pending, results, stop), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        remaining = len(jobs)
+        try:
+            while remaining:
+                try:
+                    job, data, synth_seconds, error = results.get(timeout=1)
+                except queue.Empty:
+                    with self.lock:
+                        all_dead = not any(self.alive.values())
+                        lost = time.time() - self.last_alive > self.dead_timeout
+                    if all_dead and lost:
+                        raise RuntimeError(f"No TTS worker reachable for {self.dead_timeout}s, {remaining} sentences left")
+                    continue
+                remaining -= 1
+                callback(job, data, synth_seconds, error, pending.qsize())
+        finally:
+            stop.set()
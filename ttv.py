@@ -1,4 +1,16 @@
+import time
+START_TIME = time.time()
+
 import argparse
+from metrics import metrics
+
+def add_metrics_arguments(subparser):
+    subparser.add_argument("--metrics-port", type=int, default=None, help="Serve progress metrics over HTTP on this local port (/metrics, /metrics.json)")
+    subparser.add_argument("--progress", action="store_true", help="Show a compact progress line on the terminal")
+
+def mark_startup():
+    """记录从启动到命令所需模块加载完毕的时间"""
+    metrics.set("startup_seconds", time.time() - START_TIME)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -19,12 +31,15 @@ def main():
     parser_tts.add_argument("-p", "--ppt", default="output.pptx", help="Input PPT file")
     parser_tts.add_argument("-o", "--output-dir", default="audio", help="Directory for output files")
     parser_tts.add_argument("-l", "--lang", default="zh", choices=["zh", "en"], help="Language (zh or en)")
+    parser_tts.add_argument("--workers", nargs="+", default=None, help="Remote TTS workers (host:port) to shard synthesis across")
+    add_metrics_arguments(parser_tts)
 
     # ppt2video 命令
     parser_ppt2video = subparsers.add_parser("ppt2video", help="Convert PPT to video")
     parser_ppt2video.add_argument("-p", "--ppt", default="output.pptx", help="Input PPT file")
     parser_ppt2video.add_argument("-v", "--video", default="output.mp4", help="Output video file")
     parser_ppt2video.add_argument("-o", "--output-dir", default="audio", help="Directory for output files")
+    add_metrics_arguments(parser_ppt2video)
 
     # all 命令
     parser_all = subparsers.add_parser("all", help="Run all steps: Word to PPT, TTS, and PPT to video")
@@ -35,33 +50,163 @@ def main():
     parser_all.add_argument("-l", "--lang", default="zh", choices=["zh", "en"], help="Language (zh or en)")
     parser_all.add_argument("-t", "--template", required=True, help="PPT template file")
     parser_all.add_argument("-m", "--max-leaf-count", type=int, default=8, help="Max leaf headings before splitting")
+    parser_all.add_argument("--workers", nargs="+", default=None, help="Remote TTS workers (host:port) to shard synthesis across")
+    add_metrics_arguments(parser_all)
+
+    # plan 命令
+    parser_plan = subparsers.add_parser("plan", help="Predict narration length and runtime without running TTS")
+    parser_plan.add_argument("inputs", nargs="+", help="Input PPT or Word documents")
+    parser_plan.add_argument("-t", "--template", help="PPT template file (required for Word documents)")
+    parser_plan.add_argument("-m", "--max-leaf-count", type=int, default=8, help="Max leaf headings before splitting")
+    parser_plan.add_argument("-l", "--lang", default="zh", choices=["zh", "en"], help="Language (zh or en)")
+    parser_plan.add_argument("--workers", type=int, default=None, help="Number of TTS workers (default: configured tts_workers or 1)")
+    parser_plan.add_argument("--slots", type=int, default=0, help="Balance the inputs across this many render slots")
+    parser_plan.add_argument("--json", action="store_true", help="Print predictions as JSON")
+
+    # worker 命令
+    parser_worker = subparsers.add_parser("worker", help="Run a TTS worker that synthesizes sentences for remote tts runs")
+    parser_worker.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser_worker.add_argument("--port", type=int, default=8001, help="Port to listen on")
+    parser_worker.add_argument("--model", default="F5TTS_v1_Base", help="F5-TTS model name")
+    parser_worker.add_argument("--device", default=None, help="Torch device, e.g. cuda:0")
+    parser_worker.add_argument("--ref-dir", nargs="+", default=None, help="Directories reference audio may be read from (default: ref_dir and prepared_prompt_dir in config.yaml)")
+
+    # inspect 命令
+    parser_inspect = subparsers.add_parser("inspect", help="Show the contents of the packed audio store")
+    parser_inspect.add_argument("-o", "--output-dir", default=None, help="Audio directory (default: output_dir in config.yaml)")
+    parser_inspect.add_argument("--list", action="store_true", help="List every sentence with its duration")
+    parser_inspect.add_argument("--compact", action="store_true", help="Drop audio no longer used by any sentence")
+
+    # calibrate 命令
+    parser_calibrate = subparsers.add_parser("calibrate", help="Calibrate adaptive NFE steps against full-step reference outputs")
+    parser_calibrate.add_argument("-p", "--ppt", default="output.pptx", help="PPT file whose notes are used as samples")
+    parser_calibrate.add_argument("-l", "--lang", default="zh", choices=["zh", "en"], help="Language (zh or en)")
+    parser_calibrate.add_argument("-n", "--samples", type=int, default=24, help="Number of sample sentences")
+
+    # prompt 命令
+    parser_prompt = subparsers.add_parser("prompt", help="Trim the reference voice prompt and report the expected speedup")
+    parser_prompt.add_argument("-p", "--ppt", default=None, help="PPT file used to estimate the average sentence length")
+    parser_prompt.add_argument("-l", "--lang", default="zh", choices=["zh", "en"], help="Language (zh or en)")
 
     # 解析参数
     args = parser.parse_args()
 
+    metrics.start_time = START_TIME
+    if getattr(args, "metrics_port", None) is not None:
+        metrics.start_server(args.metrics_port)
+    if getattr(args, "progress", False):
+        metrics.enable_progress()
+
     # 根据命令执行相应逻辑
     if args.command == "word2ppt":
         from word2pptx import Word2PPTX
+        mark_startup()
         converter = Word2PPTX(args.word, args.ppt, args.template, args.max_leaf_count)
         converter.convert()
     elif args.command == "tts":
         from text2speech import Text2Speech
-        converter = Text2Speech(args.ppt, args.lang)
+        mark_startup()
+        converter = Text2Speech(args.ppt, args.lang, workers=args.workers)
         converter.convert()
     elif args.command == "ppt2video":
         from ppt2video import PPT2Video
+        mark_startup()
         converter = PPT2Video(args.ppt, args.video)
         converter.convert()
     elif args.command == "all":
         from word2pptx import Word2PPTX
         from text2speech import Text2Speech
         from ppt2video import PPT2Video
+        mark_startup()
         word2ppt = Word2PPTX(args.word, args.ppt, args.template, args.max_leaf_count)
         word2ppt.convert()
-        tts = Text2Speech(args.ppt, args.lang)
+        tts = Text2Speech(args.ppt, args.lang, workers=args.workers)
         tts.convert()
         ppt2video = PPT2Video(args.ppt, args.video)
         ppt2video.convert()
+    elif args.command == "worker":
+        import yaml
+        from tts_worker import TTSWorker
+        mark_startup()
+        ref_dirs = args.ref_dir
+        if ref_dirs is None:
+            with open("config.yaml", 'r', encoding='utf-8') as f:
+                config = yaml.safe_load(f)
+            ref_dirs = [config.get('ref_dir', 'tts'), config.get('prepared_prompt_dir', 'tts/prepared')]
+        TTSWorker(args.model, args.device, ref_dirs).serve(args.port, args.host)
+    elif args.command == "inspect":
+        import yaml
+        from audio_store import AudioStore
+        mark_startup()
+        with open("config.yaml", 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        store = AudioStore(args.output_dir or config.get('output_dir', 'audio'), config.get('audio_format', 'flac'))
+        if args.compact:
+            store.compact()
+        if args.list:
+            for name in store.names():
+                duration = store.duration(name)
+                duration = f"{duration:6.2f}s" if duration is not None else "   ---"
+                print(f"{name} {duration} {store.text(name)}")
+        for key, value in store.stats().items():
+            print(f"{key}: {value}")
+    elif args.command == "calibrate":
+        from text2speech import Text2Speech
+        mark_startup()
+        Text2Speech(args.ppt, args.lang).calibrate_steps(args.samples)
+    elif args.command == "prompt":
+        import yaml
+        from planner import CostModel
+        from text2speech import Text2Speech
+        mark_startup()
+        # 未指定 PPT 时 python-pptx 会创建空白演示文稿，按默认句长估计
+        tts = Text2Speech(args.ppt, args.lang)
+        gen_seconds = 3.0
+        sentences = tts.sentences()
+        if sentences:
+            model = CostModel(tts.trace_file)
+            gen_seconds = sum(model.narration_seconds(tts.count_chars(t), tts.lang, tts.speed) for _, t in sentences) / len(sentences)
+        report = tts.prepare_reference(gen_seconds)
+        print(f"Reference: {report['source']} ({report['source_seconds']:.2f}s)")
+        if report["trimmed"]:
+            print(f"Prepared prompt: {tts.ref_audio} ({report['prepared_seconds']:.2f}s)")
+            print(f"Reference text: {report['ref_text']}")
+        else:
+            print(f"Reference kept as is: {report['reason']}")
+        print(f"Expected speedup per sentence (average sentence {gen_seconds:.2f}s): {report['expected_speedup']:.2f}x")
+        with open("config.yaml", 'r', encoding='utf-8') as f:
+            if not yaml.safe_load(f).get('trim_reference', False):
+                print("Set trim_reference: true in config.yaml to use the prepared prompt")
+    elif args.command == "plan":
+        import json
+        from planner import CostModel, load_for_plan, balance, print_plan, format_seconds
+        import text2speech
+        if any(f.lower().endswith(".docx") for f in args.inputs):
+            import word2pptx
+        mark_startup()
+        plans = []
+        for input_file in args.inputs:
+            tts = load_for_plan(input_file, args.lang, args.template, args.max_leaf_count)
+            workers = args.workers or len(tts.workers) or 1
+            plan = CostModel(tts.trace_file).predict(tts, workers)
+            plan["input"] = input_file
+            plans.append(plan)
+        slots = balance(plans, args.slots) if args.slots > 0 else None
+        if args.json:
+            result = {"plans": plans, "startup_seconds": metrics.get("startup_seconds")}
+            if slots is not None:
+                result["slots"] = [[p["input"] for p in slot] for slot in slots]
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+        else:
+            for plan in plans:
+                print_plan(plan)
+            if slots is not None:
+                for i, slot in enumerate(slots):
+                    total = sum(p["total_seconds"] for p in slot)
+                    print(f"Slot {i}: {format_seconds(total)} {[p['input'] for p in slot]}")
+
+    if getattr(args, "progress", False):
+        metrics.finish_progress()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
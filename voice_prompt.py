@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+CLAUSE_PUNCTUATION = r'[.,!?;:。，！？；：]'
+
+
+def read_ref_text(ref_text):
+    """ref_text 可以是文本本身，也可以是文本文件路径"""
+    if os.path.isfile(ref_text):
+        with open(ref_text, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    return ref_text
+
+
+def find_silences(data, sample_rate, frame_ms=20, threshold_db=-40, min_silence_ms=120):
+    """返回静音段列表 [(开始秒, 结束秒)]，阈值相对于最响的一帧"""
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    count = len(data) // frame
+    if count == 0:
+        return []
+    frames = data[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1)) + 1e-10
+    db = 20 * np.log10(rms / rms.max())
+    silent = db < threshold_db
+
+    silences = []
+    start = None
+    for i, s in enumerate(list(silent) + [False]):
+        if s and start is None:
+            start = i
+        elif not s and start is not None:
+            if (i - start) * frame_ms >= min_silence_ms:
+                silences.append((start * frame / sample_rate, i * frame / sample_rate))
+            start = None
+    return silences
+
+
+def clause_fractions(text):
+    """每个分句结束处在全文有效字符中的位置比例，以及对应的文本前缀"""
+    parts = re.split(f'({CLAUSE_PUNCTUATION})', text)
+    total = len(re.sub(rf'{CLAUSE_PUNCTUATION}|\s', '', text)) or 1
+    result = []
+    prefix = ""
+    for i in range(0, len(parts) - 1, 2):
+        prefix += parts[i] + parts[i + 1]
+        chars = len(re.sub(rf'{CLAUSE_PUNCTUATION}|\s', '', prefix))
+        if chars:
+            result.append((chars / total, prefix.strip()))
+    return result
+
+
+def estimate_speedup(ref_seconds, trimmed_seconds, gen_seconds):
+    """F5-TTS 每句的计算量大致与参考音频加生成音频的总长度成正比"""
+    return (ref_seconds + gen_seconds) / (trimmed_seconds + gen_seconds)
+
+
+class VoicePrompt:
+    """从参考音频中选出合适长度的片段，在静音处裁剪并对齐参考文本，结果缓存到 prepared_dir"""
+
+    def __init__(self, prepared_dir="tts/prepared", target_seconds=8.0, min_seconds=3.0, max_alignment_error=0.08):
+        self.prepared_dir = prepared_dir
+        self.target_seconds = target_seconds
+        self.min_seconds = min_seconds
+        self.max_alignment_error = max_alignment_error
+
+    def cache_name(self, ref_audio, ref_text):
+        st = os.stat(ref_audio)
+        settings = [os.path.abspath(ref_audio), st.st_size, int(st.st_mtime), ref_text,
+                    self.target_seconds, self.min_seconds, self.max_alignment_error]
+        return hashlib.sha1(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+    def choose_cut(self, data, sample_rate, ref_text):
+        """返回 (裁剪秒数, 对齐后的文本, 对齐误差)，找不到合适的静音切点时返回 None"""
+        silences = find_silences(data, sample_rate)
+        if not silences:
+            return None
+        # 只按有声部分估计说话进度，忽略停顿
+        speech_total = len(data) / sample_rate - sum(e - s for s, e in silences)
+        clauses = clause_fractions(ref_text)
+        best = None
+        for start, end in silences:
+            cut = (start + end) / 2
+            if not self.min_seconds <= cut <= self.target_seconds:
+                continue
+            speech = cut - sum(min(e, cut) - s for s, e in silences if s < cut)
+            fraction = speech / speech_total
+            for clause_fraction, prefix in clauses:
+                error = abs(fraction - clause_fraction)
+                if error > self.max_alignment_error:
+                    continue
+                # 误差可接受时优先选更长的片段，保留更多音色信息
+                if best is None or cut > best[0]:
+                    best = (cut, prefix, error)
+        return best
+
+    def prepare(self, ref_audio, ref_text, gen_seconds=3.0):
+        """返回 (参考音频路径, 参考文本, 报告)；音频足够短或无法可靠对齐时返回原始参考"""
+        import soundfile as sf
+        ref_text = read_ref_text(ref_text)
+        name = self.cache_name(ref_audio, ref_text)
+        audio_file = os.path.join(self.prepared_dir, name + ".wav")
+        info_file = os.path.join(self.prepared_dir, name + ".json")
+        report = None
+        if os.path.exists(info_file):
+            with open(info_file, "r", encoding="utf-8") as f:
+                report = json.load(f)
+            if report["trimmed"] and not os.path.exists(audio_file):
+                report = None
+        if report is None:
+            data, sample_rate = sf.read(ref_audio, always_2d=True)
+            data = data.mean(axis=1)
+            duration = len(data) / sample_rate
+            report = {"source": ref_audio, "source_seconds": duration, "ref_text": ref_text,
+                      "prepared_seconds": duration, "trimmed": False}
+            if duration > self.target_seconds:
+                cut = self.choose_cut(data, sample_rate, ref_text)
+                if cut is None:
+                    report["reason"] = "no silence boundary aligned with a clause"
+                else:
+                    seconds, text, error = cut
+                    os.makedirs(self.prepared_dir, exist_ok=True)
+                    sf.write(audio_file, data[:int(seconds * sample_rate)], sample_rate)
+                    report.update({"prepared_seconds": seconds, "ref_text": text,
+                                   "alignment_error": error, "trimmed": True})
+            else:
+                report["reason"] = "reference already shorter than target"
+            os.makedirs(self.prepared_dir, exist_ok=True)
+            with open(info_file, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        report["expected_speedup"] = estimate_speedup(report["source_seconds"], report["prepared_seconds"], gen_seconds)
+        if report["trimmed"]:
+            return audio_file, report["ref_text"], report
+        return ref_audio, ref_text, report
@@ -3,6 +3,7 @@ from docx import Document
 from pptx import Presentation
 from docx.oxml.ns import qn
 import io
+from metrics import metrics
 
 class Word2PPTX:
     def __init__(self, input_doc, output_ppt, template_ppt, max_leaf_count=8):
@@ -119,8 +120,8 @@ class Word2PPTX:
         
         return slide
 
-    def convert(self):
-        """执行Word到PPT转换"""
+    def build(self):
+        """在内存中生成幻灯片，不保存文件"""
         # 第一页：文章标题
         title = None
         title_idx = -1
@@ -309,6 +310,12 @@ class Word2PPTX:
                             self.add_slide(1, section_title, subheadings, current_notes)
                         slide_idx += 1
 
+        metrics.set("pptx_slides", len(self.prs.slides))
+        return self.prs
+
+    def convert(self):
+        """执行Word到PPT转换"""
+        self.build()
         self.prs.save(self.output_ppt)
         print(f"PPT saved as {self.output_ppt} with {len(self.prs.slides)} slides")
         return self.output_ppt
\ No newline at end of file